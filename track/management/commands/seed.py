@@ -1,10 +1,120 @@
+import csv
+import io
+import os
+import re
+from itertools import islice
+
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.functions import Length
 from faker import Faker
-from random import randint, uniform, choice
+from random import randint, uniform, choice, choices, seed
 from django.utils import timezone
 from track.models import Location, Driver, Carrier, Vehicle, Trip, TripEvent
 
-fake = Faker()
+# Uniform sampling skips Faker's weighted-choice machinery for names/addresses
+fake = Faker(use_weighting=False)
+
+COPY_NULL = r"\N"
+
+# Keep each multi-row INSERT well below the database's bind-parameter limit.
+BULK_BATCH_SIZE = int(os.environ.get("SEED_BULK_BATCH_SIZE", "1000"))
+TRIP_EVENT_BATCH_SIZE = 10500 // len(TripEvent._meta.concrete_fields)
+
+EVENT_TYPES = tuple(value for value, _ in TripEvent.EVENT_TYPE_CHOICES)
+DURATION_EVENT_TYPES = frozenset({"driving", "on_duty", "off_duty", "sleeper"})
+CYCLE_RULES = tuple(value for value, _ in Trip.CYCLE_RULE_CHOICES)
+
+
+def _chunked(iterable, size):
+    """Yield lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _next_serial(model, field, prefix):
+    """Return one past the highest numeric suffix already used by prefix in field.
+
+    Counting rows instead would hand out a used number again after a delete.
+    """
+    last = (
+        model.objects.filter(**{f"{field}__regex": rf"^{re.escape(prefix)}[0-9]+$"})
+        .order_by(Length(field).desc(), f"-{field}")
+        .values_list(field, flat=True)
+        .first()
+    )
+    return int(last[len(prefix) :]) + 1 if last else 0
+
+
+def _new_carrier_names(num):
+    """Generate num company names not already taken by a carrier"""
+    names = {}
+    while len(names) < num:
+        candidates = [fake.company() for _ in range(num - len(names))]
+        taken = set(
+            Carrier.objects.filter(name__in=candidates).values_list("name", flat=True)
+        )
+        names.update(
+            (name, None)
+            for name in candidates
+            if name not in taken and name not in names
+        )
+    return list(names)
+
+
+def _copy_insert(model, objs, **bulk_create_kwargs):
+    """Insert objs with PostgreSQL COPY, falling back to bulk_create elsewhere.
+
+    Primary keys are reserved from the table's sequence up front so the
+    inserted objects come back with their pk set, as with bulk_create.
+    """
+    if connection.vendor != "postgresql":
+        return model.objects.bulk_create(objs, **bulk_create_kwargs)
+    if not objs:
+        return objs
+
+    opts = model._meta
+    fields = opts.concrete_fields
+    columns = ", ".join(connection.ops.quote_name(f.column) for f in fields)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) "
+            "FROM generate_series(1, %s)",
+            [opts.db_table, opts.pk.column, len(objs)],
+        )
+        for obj, (pk,) in zip(objs, cursor.fetchall()):
+            obj.pk = pk
+
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for obj in objs:
+            row = []
+            for field in fields:
+                value = field.get_db_prep_save(
+                    field.pre_save(obj, add=True), connection=connection
+                )
+                row.append(COPY_NULL if value is None else value)
+            writer.writerow(row)
+        buf.seek(0)
+
+        sql = (
+            f"COPY {connection.ops.quote_name(opts.db_table)} ({columns}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+        )
+        if hasattr(cursor, "copy_expert"):
+            # psycopg2
+            cursor.copy_expert(sql, buf)
+        else:
+            # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buf.getvalue())
+
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = connection.alias
+    return objs
 
 
 class Command(BaseCommand):
@@ -14,32 +124,48 @@ class Command(BaseCommand):
         parser.add_argument(
             "--num", type=int, default=10, help="Number of trips to generate"
         )
+        parser.add_argument(
+            "--seed", type=int, help="Random seed for reproducible seed data"
+        )
 
     def handle(self, *args, **kwargs):
         num_records = kwargs["num"]
+        if kwargs["seed"] is not None:
+            Faker.seed(kwargs["seed"])
+            seed(kwargs["seed"])
         self.stdout.write(
             self.style.SUCCESS(
                 f"Starting seed data generation for {num_records} trips..."
             )
         )
 
-        self.stdout.write(self.style.SUCCESS("Generating Locations..."))
-        locations = self.create_locations(num_records * 5)
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # Seed data is reproducible, so skip waiting on the WAL flush
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL synchronous_commit = OFF")
 
-        self.stdout.write(self.style.SUCCESS("Generating Drivers..."))
-        drivers = self.create_drivers(num_records)
+            self.stdout.write(self.style.SUCCESS("Generating Locations..."))
+            locations = self.create_locations(num_records * 5)
 
-        self.stdout.write(self.style.SUCCESS("Generating Carriers..."))
-        carriers = self.create_carriers(num_records // 2 or 1)
+            self.stdout.write(self.style.SUCCESS("Generating Drivers..."))
+            drivers = self.create_drivers(num_records)
 
-        self.stdout.write(self.style.SUCCESS("Generating Vehicles..."))
-        vehicles = self.create_vehicles(carriers, num_records)
+            self.stdout.write(self.style.SUCCESS("Generating Carriers..."))
+            carriers = self.create_carriers(num_records // 2 or 1)
 
-        self.stdout.write(self.style.SUCCESS("Generating Trips..."))
-        trips = self.create_trips(drivers, vehicles, num_records)
+            self.stdout.write(self.style.SUCCESS("Generating Vehicles..."))
+            vehicles = self.create_vehicles(carriers, num_records)
 
-        self.stdout.write(self.style.SUCCESS("Generating Trip Events..."))
-        self.create_trip_events(trips, locations)
+            self.stdout.write(self.style.SUCCESS("Generating Trips..."))
+            trips = self.create_trips(drivers, vehicles, num_records)
+
+            self.stdout.write(self.style.SUCCESS("Generating Trip Events..."))
+            self.create_trip_events(trips, locations)
+
+            # Trips were bulk inserted without save(), so their drivers'
+            # cached totals and trip counts are rebuilt in one pass
+            Driver.refresh_cached_totals(driver.pk for driver in drivers)
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -48,121 +174,151 @@ class Command(BaseCommand):
         )
 
     def create_locations(self, num=100):
-        locations = []
-        for _ in range(num):
-            address = fake.street_address()
-            location = Location(
+        # Generate each column in one pass so the model loop only zips them
+        addresses = [fake.street_address() for _ in range(num)]
+        cities = [fake.city() for _ in range(num)]
+        states = [fake.state_abbr() for _ in range(num)]
+        postal_codes = [fake.postcode() for _ in range(num)]
+        latitudes = [round(uniform(-90, 90), 6) for _ in range(num)]
+        longitudes = [round(uniform(-180, 180), 6) for _ in range(num)]
+
+        locations = [
+            Location(
                 address=address,
-                latitude=round(uniform(-90, 90), 6),
-                longitude=round(uniform(-180, 180), 6),
-                city=fake.city(),
-                state=fake.state_abbr(),
+                latitude=latitude,
+                longitude=longitude,
+                city=city,
+                state=state,
                 country="USA",
-                postal_code=fake.postcode(),
+                postal_code=postal_code,
             )
-            locations.append(location)
-        Location.objects.bulk_create(locations, ignore_conflicts=True)
-        return list(Location.objects.all())
+            for address, city, state, postal_code, latitude, longitude in zip(
+                addresses, cities, states, postal_codes, latitudes, longitudes
+            )
+        ]
+        for chunk in _chunked(locations, BULK_BATCH_SIZE):
+            _copy_insert(Location, chunk, batch_size=BULK_BATCH_SIZE)
+        return locations
 
     def create_drivers(self, num=20):
         drivers = []
-        for _ in range(num):
+        start = _next_serial(Driver, "license_number", "LIC")
+        for i in range(start, start + num):
             driver = Driver(
                 driver_initial=fake.lexify(text="??").upper(),
                 full_name=fake.name(),
-                license_number=fake.unique.bothify(text="LIC#######"),
+                license_number=f"LIC{i:07d}",
                 phone_number=fake.phone_number(),
                 email=fake.email(),
             )
             drivers.append(driver)
-        Driver.objects.bulk_create(drivers, ignore_conflicts=True)
-        return list(Driver.objects.all())
+        Driver.objects.bulk_create(
+            drivers, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True
+        )
+        # ignore_conflicts leaves pks unset, so read back only this batch
+        return list(
+            Driver.objects.filter(
+                license_number__in=[driver.license_number for driver in drivers]
+            )
+        )
 
     def create_carriers(self, num=5):
         carriers = []
-        for _ in range(num):
+        start = _next_serial(Carrier, "dot_number", "DOT")
+        for i, name in enumerate(_new_carrier_names(num), start):
             carrier = Carrier(
-                name=fake.company(),
-                dot_number=fake.unique.bothify(text="DOT#####"),
+                name=name,
+                dot_number=f"DOT{i:05d}",
                 mc_number=fake.bothify(text="MC#####"),
                 address=fake.address(),
                 phone=fake.phone_number(),
             )
             carriers.append(carrier)
-        Carrier.objects.bulk_create(carriers, ignore_conflicts=True)
-        return list(Carrier.objects.all())
+        Carrier.objects.bulk_create(
+            carriers, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True
+        )
+        return list(
+            Carrier.objects.filter(
+                dot_number__in=[carrier.dot_number for carrier in carriers]
+            )
+        )
 
     def create_vehicles(self, carriers, num=20):
         vehicles = []
-        for _ in range(num):
+        start = max(
+            _next_serial(Vehicle, "truck_number", "TRK-"),
+            _next_serial(Vehicle, "vin", "VIN"),
+        )
+        for i in range(start, start + num):
             carrier = choice(carriers)
             vehicle = Vehicle(
-                truck_number=fake.unique.bothify(text="TRK-####"),
+                truck_number=f"TRK-{i:04d}",
                 make=fake.company(),
                 model=fake.word().capitalize(),
                 year=randint(2000, 2024),
-                vin=fake.unique.bothify(text="VIN###########"),
+                vin=f"VIN{i:011d}",
                 license_plate=fake.bothify(text="??-####"),
                 carrier=carrier,
             )
             vehicles.append(vehicle)
-        Vehicle.objects.bulk_create(vehicles, ignore_conflicts=True)
-        return list(Vehicle.objects.all())
+        Vehicle.objects.bulk_create(vehicles, batch_size=BULK_BATCH_SIZE)
+        return vehicles
 
     def create_trips(self, drivers, vehicles, num=10):
         trips = []
-        for _ in range(num):
-            driver = choice(drivers)
-            co_driver = choice(drivers) if randint(0, 1) else None
-            vehicle = choice(vehicles)
-
+        driver_pool = choices(drivers, k=num)
+        co_driver_pool = [
+            co_driver if has_co_driver else None
+            for co_driver, has_co_driver in zip(
+                choices(drivers, k=num), choices((True, False), k=num)
+            )
+        ]
+        vehicle_pool = choices(vehicles, k=num)
+        for driver, co_driver, vehicle in zip(
+            driver_pool, co_driver_pool, vehicle_pool
+        ):
             trip = Trip(
                 date=fake.date_this_year(),
                 driver=driver,
                 co_driver=co_driver,
                 vehicle=vehicle,
                 shipper_and_commodity=fake.bs(),
-                cycle_rule=choice(["70hr/8day", "60hr/7day"]),
+                cycle_rule=choice(CYCLE_RULES),
                 remarks=fake.text(max_nb_chars=200),
                 is_completed=bool(randint(0, 1)),
             )
             trips.append(trip)
-        Trip.objects.bulk_create(trips)
-        return list(Trip.objects.all())
+        Trip.objects.bulk_create(trips, batch_size=BULK_BATCH_SIZE)
+        return trips
 
     def create_trip_events(self, trips, locations):
-        events = []
-        event_types = [
-            "driving",
-            "on_duty",
-            "off_duty",
-            "sleeper",
-            "rest_break",
-            "fuel_stop",
-            "meal_break",
-            "inspection",
-            "loading",
-            "unloading",
-            "other",
-        ]
+        events = self.iter_trip_events(trips, locations)
+        for chunk in _chunked(events, BULK_BATCH_SIZE):
+            _copy_insert(TripEvent, chunk, batch_size=TRIP_EVENT_BATCH_SIZE)
+        Trip.recalculate_many(trip.id for trip in trips)
+
+    def iter_trip_events(self, trips, locations):
+        event_counts = [randint(3, 10) for _ in trips]
+        total_events = sum(event_counts)
+        location_pool = choices(locations, k=total_events)
+        event_type_pool = choices(EVENT_TYPES, k=total_events)
+        durations = [round(uniform(0.5, 5.0), 2) for _ in range(total_events)]
+        miles = [round(uniform(10.0, 300.0), 2) for _ in range(total_events)]
 
-        for trip in trips:
-            num_events = randint(3, 10)
+        index = 0
+        for trip, num_events in zip(trips, event_counts):
             timestamp = timezone.now()
 
             for _ in range(num_events):
-                location = choice(locations)
-                event_type = choice(event_types)
+                location = location_pool[index]
+                event_type = event_type_pool[index]
                 duration = (
-                    round(uniform(0.5, 5.0), 2)
-                    if event_type in ["driving", "on_duty", "off_duty", "sleeper"]
-                    else 0.0
-                )
-                miles_driven = (
-                    round(uniform(10.0, 300.0), 2) if event_type == "driving" else 0.0
+                    durations[index] if event_type in DURATION_EVENT_TYPES else 0.0
                 )
+                miles_driven = miles[index] if event_type == "driving" else 0.0
+                index += 1
 
-                event = TripEvent(
+                yield TripEvent(
                     trip=trip,
                     location=location,
                     event_type=event_type,
@@ -171,8 +327,5 @@ class Command(BaseCommand):
                     miles_driven=miles_driven,
                     notes=fake.text(max_nb_chars=100),
                 )
-                events.append(event)
 
                 timestamp += timezone.timedelta(hours=max(duration, 1))
-
-        TripEvent.objects.bulk_create(events)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from track.models import Driver
+
+
+class Command(BaseCommand):
+    help = "Recompute every driver's cached trip totals from the trip table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of drivers to refresh per aggregate query",
+        )
+
+    def handle(self, *args, **kwargs):
+        driver_ids = Driver.objects.order_by("pk").values_list("pk", flat=True)
+        Driver.refresh_cached_totals(driver_ids, batch_size=kwargs["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Refreshed cached totals for {len(driver_ids)} drivers")
+        )
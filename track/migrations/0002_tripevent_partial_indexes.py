@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-15 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("track", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tripevent",
+            index=models.Index(
+                condition=models.Q(("event_type", "driving")),
+                fields=["trip"],
+                name="tripevent_drv_partial",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tripevent",
+            index=models.Index(
+                condition=models.Q(
+                    ("event_type__in", ["on_duty", "off_duty", "sleeper"])
+                ),
+                fields=["trip"],
+                name="tripevent_duty_partial",
+            ),
+        ),
+    ]
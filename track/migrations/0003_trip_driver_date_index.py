@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-15 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("track", "0002_tripevent_partial_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="trip",
+            index=models.Index(
+                fields=["driver", "date"], name="track_trip_driver__1ce3ab_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-15 10:41
+
+from django.db import migrations
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS location_address_trgm "
+        "ON track_location USING gin (address gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS location_address_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("track", "0003_trip_driver_date_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-15 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("track", "0004_location_address_trgm"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tripevent",
+            index=models.Index(fields=["-timestamp", "-id"], name="tripevent_ts_id"),
+        ),
+    ]
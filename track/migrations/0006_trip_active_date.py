@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-15 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("track", "0005_tripevent_ts_id"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="trip",
+            index=models.Index(
+                condition=models.Q(("is_completed", False)),
+                fields=["-date", "-created_at"],
+                name="trip_active_date",
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-15 12:58
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_driver_totals(apps, schema_editor):
+    Driver = apps.get_model("track", "Driver")
+    Trip = apps.get_model("track", "Trip")
+    db_alias = schema_editor.connection.alias
+
+    rows = (
+        Trip.objects.using(db_alias)
+        .values("driver_id")
+        .annotate(
+            miles=Sum("total_miles_driving"),
+            driving_hours=Sum("total_driving_hours"),
+            on_duty_hours=Sum("total_on_duty_hours"),
+            trip_count=Count("id"),
+        )
+        .order_by()
+    )
+    drivers = [
+        Driver(
+            pk=row["driver_id"],
+            total_miles_cached=row["miles"] or 0.0,
+            total_driving_hours_cached=row["driving_hours"] or 0.0,
+            total_on_duty_hours_cached=row["on_duty_hours"] or 0.0,
+            trip_count_cached=row["trip_count"],
+        )
+        for row in rows
+    ]
+    Driver.objects.using(db_alias).bulk_update(
+        drivers,
+        [
+            "total_miles_cached",
+            "total_driving_hours_cached",
+            "total_on_duty_hours_cached",
+            "trip_count_cached",
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("track", "0006_trip_active_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="driver",
+            name="total_miles_cached",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="driver",
+            name="total_driving_hours_cached",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="driver",
+            name="total_on_duty_hours_cached",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="driver",
+            name="trip_count_cached",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_driver_totals, migrations.RunPython.noop),
+    ]
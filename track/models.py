@@ -1,5 +1,7 @@
+from operator import attrgetter, itemgetter
+
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
@@ -35,6 +37,15 @@ class Location(models.Model):
         return self.address
 
 
+# Cached Driver column -> the Trip column it sums
+DRIVER_TOTAL_SOURCES = {
+    "total_miles_cached": "total_miles_driving",
+    "total_driving_hours_cached": "total_driving_hours",
+    "total_on_duty_hours_cached": "total_on_duty_hours",
+}
+DRIVER_CACHED_FIELDS = (*DRIVER_TOTAL_SOURCES, "trip_count_cached")
+
+
 class Driver(models.Model):
     """Driver information"""
 
@@ -44,9 +55,73 @@ class Driver(models.Model):
     phone_number = models.CharField(max_length=20, blank=True)
     email = models.EmailField(blank=True)
 
+    # Lifetime totals over the driver's trips, kept in step with Trip saves
+    total_miles_cached = models.FloatField(default=0.0)
+    total_driving_hours_cached = models.FloatField(default=0.0)
+    total_on_duty_hours_cached = models.FloatField(default=0.0)
+    trip_count_cached = models.PositiveIntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    @classmethod
+    def refresh_cached_totals(cls, driver_ids, batch_size=1000):
+        """Recompute cached trip totals for many drivers with one grouped aggregate"""
+        from django.db.models import Count, Sum
+
+        driver_ids = list(driver_ids)
+        for start in range(0, len(driver_ids), batch_size):
+            batch_ids = driver_ids[start : start + batch_size]
+            totals = {
+                driver_id: dict.fromkeys(DRIVER_CACHED_FIELDS, 0)
+                for driver_id in batch_ids
+            }
+
+            rows = (
+                Trip.objects.filter(driver_id__in=batch_ids)
+                .values("driver_id")
+                .annotate(
+                    miles=Sum("total_miles_driving"),
+                    driving_hours=Sum("total_driving_hours"),
+                    on_duty_hours=Sum("total_on_duty_hours"),
+                    trip_count=Count("id"),
+                )
+                .order_by()
+            )
+            for row in rows:
+                totals[row["driver_id"]] = {
+                    "total_miles_cached": row["miles"] or 0.0,
+                    "total_driving_hours_cached": row["driving_hours"] or 0.0,
+                    "total_on_duty_hours_cached": row["on_duty_hours"] or 0.0,
+                    "trip_count_cached": row["trip_count"],
+                }
+
+            drivers = [
+                cls(pk=driver_id, **driver_totals)
+                for driver_id, driver_totals in totals.items()
+            ]
+            cls.objects.bulk_update(drivers, DRIVER_CACHED_FIELDS)
+
+    @classmethod
+    def add_to_cached_totals(cls, driver_id, trip_count, deltas):
+        """Shift one driver's cached totals in place with a single UPDATE
+
+        ``deltas`` lines up with DRIVER_TOTAL_SOURCES. Results are floored at
+        zero: rows inserted without save() (bulk_create, loaddata) were never
+        counted, and removing them must not fail the positive check.
+        """
+        from django.db.models.functions import Greatest
+
+        if not trip_count and not any(deltas):
+            return
+        cls.objects.filter(pk=driver_id).update(
+            trip_count_cached=Greatest(models.F("trip_count_cached") + trip_count, 0),
+            **{
+                field: Greatest(models.F(field) + delta, 0.0)
+                for field, delta in zip(DRIVER_TOTAL_SOURCES, deltas)
+            },
+        )
+
     def __str__(self):
         return f"{self.driver_initial} - {self.full_name}"
 
@@ -85,10 +160,74 @@ class Vehicle(models.Model):
         return f"{self.truck_number} - {self.make} {self.model}"
 
 
+HOURS_FIELD_BY_EVENT_TYPE = {
+    "driving": "total_driving_hours",
+    "on_duty": "total_on_duty_hours",
+    "off_duty": "total_off_duty_hours",
+    "sleeper": "total_sleeper_hours",
+}
+TRIP_TOTAL_FIELDS = (*HOURS_FIELD_BY_EVENT_TYPE.values(), "total_miles_driving")
+# Trip attributes that make up its contribution to the driver's cached totals
+TRIP_DRIVER_SHARE_FIELDS = ("driver_id", *DRIVER_TOTAL_SOURCES.values())
+
+
+def _schedule_on_commit(attr, flush, ids):
+    """Collect ids on the connection and pass them to flush() once, on commit"""
+    connection = transaction.get_connection()
+    pending = getattr(connection, attr, None)
+    if pending is None:
+        pending = set()
+        setattr(connection, attr, pending)
+    pending.update(pk for pk in ids if pk is not None)
+    # Every save registers a callback so none are lost to a savepoint
+    # rollback; the first one to run drains the set and the rest are no-ops.
+    transaction.on_commit(lambda: _flush_on_commit(connection, attr, flush))
+
+
+def _flush_on_commit(connection, attr, flush):
+    pending = getattr(connection, attr)
+    if pending:
+        setattr(connection, attr, set())
+        try:
+            flush(pending)
+        except Exception:
+            # Keep the ids so the next commit on this connection retries them
+            getattr(connection, attr).update(pending)
+            raise
+
+
+def _schedule_totals_recalc(*trip_ids):
+    """Recalculate trip totals once, when the current transaction commits"""
+    _schedule_on_commit("_pending_trip_recalc", Trip.recalculate_many, trip_ids)
+
+
+def _shift_driver_totals(old, new):
+    """Move one trip's share of the cached driver totals from old to new
+
+    Both are ``(driver_id, *totals)`` tuples as built by
+    Trip._driver_share(), or None when the trip does not exist on that side.
+    """
+    if old == new:
+        return
+    if old and new and old[0] == new[0]:
+        deltas = [after - before for before, after in zip(old[1:], new[1:])]
+        Driver.add_to_cached_totals(new[0], 0, deltas)
+        return
+    changes = []
+    if old:
+        changes.append((old[0], -1, [-value for value in old[1:]]))
+    if new:
+        changes.append((new[0], 1, new[1:]))
+    # Update drivers in pk order, as recalculate_many does
+    for driver_id, trip_count, deltas in sorted(changes, key=itemgetter(0)):
+        Driver.add_to_cached_totals(driver_id, trip_count, deltas)
+
+
 class Trip(models.Model):
     """Main trip record"""
 
     CYCLE_RULE_CHOICES = [("70hr/8day", "70hr/8day"), ("60hr/7day", "60hr/7day")]
+    DESTINATION_EVENT_TYPES = ["driving"]
 
     date = models.DateField()
 
@@ -127,20 +266,55 @@ class Trip(models.Model):
         """Calculate total cycle hours (driving + on duty)"""
         return self.total_driving_hours + self.total_on_duty_hours
 
+    def loaded_events(self):
+        """Return prefetched events ordered by timestamp, or None if not prefetched"""
+        if hasattr(self, "prefetched_events"):
+            return self.prefetched_events
+        if "events" not in getattr(self, "_prefetched_objects_cache", {}):
+            return None
+        return sorted(self.events.all(), key=lambda event: event.timestamp)
+
+    @classmethod
+    def route_events(cls, events, event_type=attrgetter("event_type")):
+        """Return the (origin, latest, destination) of timestamp-ordered events
+
+        ``event_type`` reads an event's type, so plain dict rows can be passed
+        with ``itemgetter("event_type")``. Missing events are None.
+        """
+        if not events:
+            return None, None, None
+        destination = next(
+            (
+                event
+                for event in reversed(events)
+                if event_type(event) in cls.DESTINATION_EVENT_TYPES
+            ),
+            None,
+        )
+        return events[0], events[-1], destination
+
     @property
     def origin_location(self):
         """Get the first location of the trip"""
-        first_event = self.events.order_by("timestamp").first()
+        events = self.loaded_events()
+        if events is not None:
+            first_event, _, _ = self.route_events(events)
+        else:
+            first_event = self.events.order_by("timestamp").first()
         return first_event.location if first_event else None
 
     @property
     def destination_location(self):
         """Get the final destination of the trip"""
-        last_driving_event = (
-            self.events.filter(event_type__in=["driving_start", "driving_end"])
-            .order_by("-timestamp")
-            .first()
-        )
+        events = self.loaded_events()
+        if events is not None:
+            _, _, last_driving_event = self.route_events(events)
+        else:
+            last_driving_event = (
+                self.events.filter(event_type__in=self.DESTINATION_EVENT_TYPES)
+                .order_by("-timestamp")
+                .first()
+            )
         return last_driving_event.location if last_driving_event else None
 
     def calculate_totals(self):
@@ -166,11 +340,113 @@ class Trip(models.Model):
 
         self.save()
 
+    @classmethod
+    def recalculate_many(cls, trip_ids, batch_size=1000):
+        """Recalculate totals for many trips with one grouped aggregate per batch"""
+        from django.db.models import Sum
+
+        trip_ids = list(trip_ids)
+        for start in range(0, len(trip_ids), batch_size):
+            batch_ids = trip_ids[start : start + batch_size]
+            with transaction.atomic():
+                # Lock the trips so concurrent recalculations apply their
+                # driver deltas against the totals they actually replace.
+                # Trips, then drivers, are locked in pk order so two
+                # overlapping recalculations cannot deadlock.
+                previous = {
+                    row[0]: row[1:]
+                    for row in cls.objects.select_for_update()
+                    .filter(pk__in=batch_ids)
+                    .order_by("pk")
+                    .values_list("id", *TRIP_DRIVER_SHARE_FIELDS)
+                }
+                totals = {
+                    trip_id: dict.fromkeys(TRIP_TOTAL_FIELDS, 0.0)
+                    for trip_id in previous
+                }
+
+                rows = (
+                    TripEvent.objects.filter(trip_id__in=batch_ids)
+                    .values("trip_id", "event_type")
+                    .annotate(hours=Sum("duration"), miles=Sum("miles_driven"))
+                    .order_by()
+                )
+                for row in rows:
+                    trip_totals = totals[row["trip_id"]]
+                    hours_field = HOURS_FIELD_BY_EVENT_TYPE.get(row["event_type"])
+                    if hours_field:
+                        trip_totals[hours_field] = row["hours"] or 0.0
+                    if row["event_type"] == "driving":
+                        trip_totals["total_miles_driving"] = row["miles"] or 0.0
+
+                now = timezone.now()
+                trips = [
+                    cls(pk=trip_id, updated_at=now, **trip_totals)
+                    for trip_id, trip_totals in totals.items()
+                ]
+                cls.objects.bulk_update(trips, [*TRIP_TOTAL_FIELDS, "updated_at"])
+
+                driver_deltas = {}
+                for trip_id, (driver_id, *before) in previous.items():
+                    after = [totals[trip_id][f] for f in DRIVER_TOTAL_SOURCES.values()]
+                    deltas = driver_deltas.setdefault(driver_id, [0.0] * len(before))
+                    for i, (old, new) in enumerate(zip(before, after)):
+                        deltas[i] += new - old
+                for driver_id in sorted(driver_deltas):
+                    Driver.add_to_cached_totals(driver_id, 0, driver_deltas[driver_id])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what this row contributes to its driver's cached totals so
+        # save() and delete() can apply the difference without a lookup
+        if all(field in field_names for field in TRIP_DRIVER_SHARE_FIELDS):
+            instance._loaded_driver_share = instance._driver_share()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(
+            using=using, fields=fields, from_queryset=from_queryset
+        )
+        self.__dict__.pop("_loaded_driver_share", None)
+        if fields is None and not self.get_deferred_fields().intersection(
+            TRIP_DRIVER_SHARE_FIELDS
+        ):
+            self._loaded_driver_share = self._driver_share()
+
+    def _driver_share(self):
+        return tuple(getattr(self, field) for field in TRIP_DRIVER_SHARE_FIELDS)
+
+    def _stored_driver_share(self):
+        if self._state.adding:
+            return None
+        if hasattr(self, "_loaded_driver_share"):
+            return self._loaded_driver_share
+        return (
+            Trip.objects.filter(pk=self.pk)
+            .values_list(*TRIP_DRIVER_SHARE_FIELDS)
+            .first()
+        )
+
+    def save(self, *args, **kwargs):
+        previous = self._stored_driver_share()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            current = self._driver_share()
+            _shift_driver_totals(previous, current)
+        self._loaded_driver_share = current
+
     class Meta:
         ordering = ["-date", "-created_at"]
         indexes = [
             models.Index(fields=["date", "driver"]),
+            models.Index(fields=["driver", "date"]),
             models.Index(fields=["vehicle", "date"]),
+            models.Index(
+                fields=["-date", "-created_at"],
+                condition=models.Q(is_completed=False),
+                name="trip_active_date",
+            ),
         ]
 
     def __str__(self):
@@ -222,11 +498,29 @@ class TripEvent(models.Model):
             models.Index(fields=["trip", "timestamp"]),
             models.Index(fields=["event_type", "timestamp"]),
             models.Index(fields=["location", "timestamp"]),
+            models.Index(
+                fields=["trip"],
+                condition=models.Q(event_type="driving"),
+                name="tripevent_drv_partial",
+            ),
+            models.Index(
+                fields=["trip"],
+                condition=models.Q(event_type__in=["on_duty", "off_duty", "sleeper"]),
+                name="tripevent_duty_partial",
+            ),
+            models.Index(fields=["-timestamp", "-id"], name="tripevent_ts_id"),
         ]
 
     def save(self, *args, **kwargs):
+        previous_trip_id = None
+        if not self._state.adding:
+            previous_trip_id = (
+                TripEvent.objects.filter(pk=self.pk)
+                .values_list("trip_id", flat=True)
+                .first()
+            )
         super().save(*args, **kwargs)
-        self.trip.calculate_totals()
+        _schedule_totals_recalc(self.trip_id, previous_trip_id)
 
     def __str__(self):
         return f"{self.trip.id} - {self.get_event_type_display()} at {self.location.address}"
@@ -0,0 +1,21 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def dumps_json(data):
+    """Encode data with orjson, falling back to DRF's encoder for other types"""
+    return orjson.dumps(
+        data,
+        default=JSONEncoder().default,
+        option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson, falling back to DRF's encoder"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return dumps_json(data)
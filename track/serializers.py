@@ -1,7 +1,18 @@
+from collections import defaultdict
+from operator import itemgetter
+
 from rest_framework import serializers
 from django.db import transaction
-from .models import Location, Driver, Carrier, Vehicle, Trip, TripEvent
-from time import timezone
+from .models import (
+    Location,
+    Driver,
+    Carrier,
+    Vehicle,
+    Trip,
+    TripEvent,
+    TRIP_TOTAL_FIELDS,
+)
+from django.utils import timezone
 
 
 class LocationSerializer(serializers.ModelSerializer):
@@ -23,12 +34,37 @@ class LocationSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         # Check if location already exists
         address = validated_data.get("address")
-        location, created = Location.objects.get_or_create(
-            address=address, defaults=validated_data
-        )
+        location = Location.objects.filter(address=address).first()
+        if location is None:
+            location = Location.objects.create(**validated_data)
         return location
 
 
+def _get_or_create_locations(locations_data):
+    """Return a Location per location dict, creating unknown addresses in bulk"""
+    validated = []
+    for location_data in locations_data:
+        location_serializer = LocationSerializer(data=location_data)
+        if not location_serializer.is_valid():
+            raise serializers.ValidationError(location_serializer.errors)
+        validated.append(location_serializer.validated_data)
+
+    addresses = {location_data["address"] for location_data in validated}
+    by_address = {}
+    for location in Location.objects.filter(address__in=addresses):
+        by_address.setdefault(location.address, location)
+
+    new_locations = {}
+    for location_data in validated:
+        address = location_data["address"]
+        if address not in by_address and address not in new_locations:
+            new_locations[address] = Location(**location_data)
+    Location.objects.bulk_create(new_locations.values())
+    by_address.update(new_locations)
+
+    return [by_address[location_data["address"]] for location_data in validated]
+
+
 class DriverSerializer(serializers.ModelSerializer):
     class Meta:
         model = Driver
@@ -61,7 +97,11 @@ class CarrierSerializer(serializers.ModelSerializer):
         ]
 
     def get_vehicles_count(self, obj):
-        return obj.vehicles.count()
+        # Annotated by CarrierViewSet; fall back to a query for other callers
+        vehicles_count = getattr(obj, "_vehicles_count", None)
+        if vehicles_count is None:
+            vehicles_count = obj.vehicles.count()
+        return vehicles_count
 
 
 class VehicleSerializer(serializers.ModelSerializer):
@@ -140,10 +180,10 @@ class TripSerializer(serializers.ModelSerializer):
     carrier_name = serializers.CharField(source="vehicle.carrier.name", read_only=True)
 
     cycle_hours_used = serializers.ReadOnlyField()
-    origin_location = LocationSerializer(read_only=True)
-    destination_location = LocationSerializer(read_only=True)
+    origin_location = serializers.SerializerMethodField()
+    destination_location = serializers.SerializerMethodField()
 
-    events = TripEventSerializer(many=True, read_only=True)
+    events = serializers.SerializerMethodField()
     events_count = serializers.SerializerMethodField()
 
     current_location = serializers.SerializerMethodField()
@@ -192,39 +232,59 @@ class TripSerializer(serializers.ModelSerializer):
             "cycle_hours_used",
         ]
 
+    def get_events(self, obj):
+        return TripEventSerializer(obj.prefetched_events, many=True).data
+
     def get_events_count(self, obj):
-        return obj.events.count()
+        return len(obj.prefetched_events)
+
+    def to_representation(self, instance):
+        # Load the trip's events once and keep them, with the route locations,
+        # on the instance: with many=True this serializer is shared by every
+        # row, so it must not hold per-row state itself.
+        events = instance.loaded_events()
+        if events is None:
+            events = list(instance.events.select_related("location"))
+        instance.prefetched_events = events
+        instance.route_locations = tuple(
+            LocationSerializer(event.location).data if event else None
+            for event in Trip.route_events(events)
+        )
+        return super().to_representation(instance)
+
+    def get_origin_location(self, obj):
+        origin, _, _ = obj.route_locations
+        return origin
+
+    def get_destination_location(self, obj):
+        _, _, destination = obj.route_locations
+        return destination
 
     def get_current_location(self, obj):
         """For backward compatibility - return the most recent location"""
-        latest_event = obj.events.order_by("-timestamp").first()
-        if latest_event:
-            return {
-                "address": latest_event.location.address,
-                "lat": latest_event.location.latitude,
-                "lng": latest_event.location.longitude,
-            }
-        return None
+        _, latest, _ = obj.route_locations
+        return _location_point(latest)
 
     def get_pickup_location(self, obj):
         """For backward compatibility - return origin location"""
-        if obj.origin_location:
-            return {
-                "address": obj.origin_location.address,
-                "lat": obj.origin_location.latitude,
-                "lng": obj.origin_location.longitude,
-            }
-        return None
+        origin, _, _ = obj.route_locations
+        return _location_point(origin)
 
     def get_dropoff_location(self, obj):
         """For backward compatibility - return destination location"""
-        if obj.destination_location:
-            return {
-                "address": obj.destination_location.address,
-                "lat": obj.destination_location.latitude,
-                "lng": obj.destination_location.longitude,
-            }
-        return None
+        _, _, destination = obj.route_locations
+        return _location_point(destination)
+
+
+def _location_point(location):
+    """Legacy address/lat/lng dict for a LocationSerializer payload"""
+    if location:
+        return {
+            "address": location["address"],
+            "lat": location["latitude"],
+            "lng": location["longitude"],
+        }
+    return None
 
 
 class TripCreateSerializer(serializers.ModelSerializer):
@@ -331,9 +391,110 @@ class TripCreateSerializer(serializers.ModelSerializer):
         trip = Trip.objects.create(**validated_data)
 
         all_events = initial_events_data + legacy_locations
+        events_data = []
         for event_data in all_events:
             event_serializer = TripEventCreateSerializer(data=event_data)
             if event_serializer.is_valid():
-                event_serializer.save(trip=trip)
+                events_data.append(dict(event_serializer.validated_data))
+
+        locations = _get_or_create_locations(
+            [event_data.pop("location_data") for event_data in events_data]
+        )
+        TripEvent.objects.bulk_create(
+            [
+                TripEvent(trip=trip, location=location, **event_data)
+                for event_data, location in zip(events_data, locations)
+            ],
+            batch_size=500,
+        )
+        trip.calculate_totals()
 
         return trip
+
+
+# Plain-dict renderings of TripEventSerializer/TripSerializer built from
+# .values() rows, for read-only listings where ModelSerializer dominates.
+LOCATION_VALUE_FIELDS = tuple(LocationSerializer.Meta.fields)
+TRIP_EVENT_VALUE_FIELDS = (
+    "id",
+    "event_type",
+    "timestamp",
+    "duration",
+    "miles_driven",
+    "notes",
+    "location",
+    "created_at",
+    "updated_at",
+    *(f"location__{field}" for field in LOCATION_VALUE_FIELDS),
+)
+TRIP_VALUE_FIELDS = (
+    "id",
+    "date",
+    "driver",
+    "co_driver",
+    "vehicle",
+    "shipper_and_commodity",
+    "cycle_rule",
+    *TRIP_TOTAL_FIELDS,
+    "total_mileage_today",
+    "remarks",
+    "is_completed",
+    "created_at",
+    "updated_at",
+    "driver__full_name",
+    "co_driver__full_name",
+    "vehicle__truck_number",
+    "vehicle__carrier__name",
+)
+
+
+def trip_event_to_dict(row):
+    """TripEventSerializer output for a .values(*TRIP_EVENT_VALUE_FIELDS) row"""
+    location = {field: row.pop(f"location__{field}") for field in LOCATION_VALUE_FIELDS}
+    row["location_address"] = location["address"]
+    row["location_data"] = location
+    return {field: row[field] for field in TripEventSerializer.Meta.fields}
+
+
+def trip_to_dict(row, events):
+    """TripSerializer output for a .values(*TRIP_VALUE_FIELDS) row and its events"""
+    data = {field: value for field, value in row.items() if "__" not in field}
+    data.update(
+        driver_name=row["driver__full_name"],
+        vehicle_info=row["vehicle__truck_number"],
+        carrier_name=row["vehicle__carrier__name"],
+    )
+    # TripSerializer skips co_driver_name when there is no co-driver
+    if row["co_driver"] is not None:
+        data["co_driver_name"] = row["co_driver__full_name"]
+    data["cycle_hours_used"] = row["total_driving_hours"] + row["total_on_duty_hours"]
+
+    origin, latest, destination = (
+        event["location_data"] if event else None
+        for event in Trip.route_events(events, itemgetter("event_type"))
+    )
+    data.update(
+        events=events,
+        events_count=len(events),
+        origin_location=origin,
+        destination_location=destination,
+        current_location=_location_point(latest),
+        pickup_location=_location_point(origin),
+        dropoff_location=_location_point(destination),
+    )
+    return {field: data[field] for field in TripSerializer.Meta.fields if field in data}
+
+
+def trip_rows_to_dicts(trip_rows):
+    """Render trip rows, loading all of their events with one query"""
+    trip_rows = list(trip_rows)
+    events_by_trip = defaultdict(list)
+    event_rows = (
+        TripEvent.objects.filter(trip_id__in=[row["id"] for row in trip_rows])
+        .order_by("timestamp")
+        .values("trip_id", *TRIP_EVENT_VALUE_FIELDS)
+    )
+    for event_row in event_rows:
+        trip_id = event_row.pop("trip_id")
+        events_by_trip[trip_id].append(trip_event_to_dict(event_row))
+    return [trip_to_dict(row, events_by_trip[row["id"]]) for row in trip_rows]
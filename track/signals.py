@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import Trip, TripEvent, _schedule_totals_recalc, _shift_driver_totals
+
+# Deletes are handled here rather than in Model.delete() overrides because the
+# delete collector sends these signals for cascaded rows too, e.g. the trips
+# of a deleted vehicle or the events at a deleted location.
+
+
+@receiver(pre_delete, sender=Trip)
+def remember_trip_driver_share(sender, instance, **kwargs):
+    instance._deleted_driver_share = instance._stored_driver_share()
+
+
+@receiver(post_delete, sender=Trip)
+def remove_trip_driver_share(sender, instance, **kwargs):
+    _shift_driver_totals(instance.__dict__.pop("_deleted_driver_share", None), None)
+
+
+@receiver(post_delete, sender=TripEvent)
+def recalculate_trip_after_event_delete(sender, instance, **kwargs):
+    _schedule_totals_recalc(instance.trip_id)
@@ -1,3 +1,511 @@
+import json
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import (
+    DRIVER_CACHED_FIELDS,
+    Carrier,
+    Driver,
+    Location,
+    Trip,
+    TripEvent,
+    Vehicle,
+)
+from .renderers import dumps_json
+from .serializers import (
+    TRIP_VALUE_FIELDS,
+    TripCreateSerializer,
+    TripSerializer,
+    trip_rows_to_dicts,
+)
+
+
+class TotalsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = Driver.objects.create(
+            driver_initial="AB", full_name="Alex Brown", license_number="LIC0000001"
+        )
+        cls.other_driver = Driver.objects.create(
+            driver_initial="CD", full_name="Casey Dunn", license_number="LIC0000002"
+        )
+        carrier = Carrier.objects.create(name="Acme Freight", dot_number="DOT00001")
+        cls.vehicle = Vehicle.objects.create(
+            truck_number="TRK-0001", vin="VIN00000000001", carrier=carrier
+        )
+        cls.location = Location.objects.create(
+            address="1 Main St", latitude=40.0, longitude=-75.0
+        )
+
+    def create_trip(self, driver=None):
+        return Trip.objects.create(
+            date=date(2026, 10, 15), driver=driver or self.driver, vehicle=self.vehicle
+        )
+
+    def add_event(self, trip, event_type, duration=0.0, miles_driven=0.0):
+        return TripEvent.objects.create(
+            trip=trip,
+            location=self.location,
+            event_type=event_type,
+            timestamp=timezone.now(),
+            duration=duration,
+            miles_driven=miles_driven,
+        )
+
+    def assertTripTotals(self, trip, **expected):
+        trip.refresh_from_db()
+        for field, value in expected.items():
+            self.assertEqual(getattr(trip, field), value, field)
+
+    def assertDriverTotalsMatchTrips(self, driver):
+        live = Trip.objects.filter(driver=driver).aggregate(
+            total_miles_cached=Sum("total_miles_driving", default=0.0),
+            total_driving_hours_cached=Sum("total_driving_hours", default=0.0),
+            total_on_duty_hours_cached=Sum("total_on_duty_hours", default=0.0),
+            trip_count_cached=Count("id"),
+        )
+        cached = Driver.objects.values(*DRIVER_CACHED_FIELDS).get(pk=driver.pk)
+        self.assertEqual(cached, live)
+
+
+class TripEventTotalsTests(TotalsTestCase):
+    def test_create_update_delete_keep_trip_totals(self):
+        trip = self.create_trip()
+        with self.captureOnCommitCallbacks(execute=True):
+            driving = self.add_event(trip, "driving", 2.5, 150.0)
+            self.add_event(trip, "on_duty", 0.5)
+        self.assertTripTotals(
+            trip,
+            total_driving_hours=2.5,
+            total_on_duty_hours=0.5,
+            total_miles_driving=150.0,
+        )
+
+        driving.duration = 4.0
+        driving.miles_driven = 200.0
+        with self.captureOnCommitCallbacks(execute=True):
+            driving.save()
+        self.assertTripTotals(trip, total_driving_hours=4.0, total_miles_driving=200.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            driving.delete()
+        self.assertTripTotals(
+            trip,
+            total_driving_hours=0.0,
+            total_on_duty_hours=0.5,
+            total_miles_driving=0.0,
+        )
+        self.assertDriverTotalsMatchTrips(self.driver)
+
+    def test_moving_an_event_updates_both_trips(self):
+        source = self.create_trip()
+        target = self.create_trip(driver=self.other_driver)
+        with self.captureOnCommitCallbacks(execute=True):
+            event = self.add_event(source, "driving", 3.0, 120.0)
+
+        event.trip = target
+        with self.captureOnCommitCallbacks(execute=True):
+            event.save()
+
+        self.assertTripTotals(source, total_driving_hours=0.0, total_miles_driving=0.0)
+        self.assertTripTotals(
+            target, total_driving_hours=3.0, total_miles_driving=120.0
+        )
+        self.assertDriverTotalsMatchTrips(self.driver)
+        self.assertDriverTotalsMatchTrips(self.other_driver)
+
+    def test_rolled_back_savepoint_is_not_counted(self):
+        trip = self.create_trip()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_event(trip, "driving", 1.0, 50.0)
+            try:
+                with transaction.atomic():
+                    self.add_event(trip, "driving", 6.0, 400.0)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertTripTotals(trip, total_driving_hours=1.0, total_miles_driving=50.0)
+        self.assertDriverTotalsMatchTrips(self.driver)
+
+    def test_recalc_left_pending_by_a_rolled_back_savepoint_is_harmless(self):
+        trip = self.create_trip()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.add_event(trip, "driving", 6.0, 400.0)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+
+        # The next committed save drains the leftover id along with its own
+        other_trip = self.create_trip()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_event(other_trip, "on_duty", 1.5)
+        self.assertTripTotals(trip, total_driving_hours=0.0, total_miles_driving=0.0)
+        self.assertTripTotals(other_trip, total_on_duty_hours=1.5)
+        self.assertDriverTotalsMatchTrips(self.driver)
+
+
+class TripCreateSerializerTests(TotalsTestCase):
+    def test_create_with_initial_events_sets_totals(self):
+        location_data = {"address": "9 Depot Rd", "latitude": 41.0, "longitude": -74.0}
+        serializer = TripCreateSerializer(
+            data={
+                "date": "2026-10-15",
+                "driver": self.driver.pk,
+                "vehicle": self.vehicle.pk,
+                "initial_events": [
+                    {
+                        "event_type": "driving",
+                        "timestamp": "2026-10-15T08:00:00Z",
+                        "duration": 5.5,
+                        "miles_driven": 310.0,
+                        "location_data": location_data,
+                    },
+                    {
+                        "event_type": "on_duty",
+                        "timestamp": "2026-10-15T14:00:00Z",
+                        "duration": 1.25,
+                        "location_data": location_data,
+                    },
+                ],
+            }
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            trip = serializer.save()
+
+        self.assertEqual(trip.events.count(), 2)
+        self.assertEqual(Location.objects.filter(address="9 Depot Rd").count(), 1)
+        self.assertTripTotals(
+            trip,
+            total_driving_hours=5.5,
+            total_on_duty_hours=1.25,
+            total_miles_driving=310.0,
+        )
+        self.assertDriverTotalsMatchTrips(self.driver)
+
+
+class DriverCachedTotalsTests(TotalsTestCase):
+    def test_trip_saves_and_deletes_keep_driver_totals(self):
+        trip = self.create_trip()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_event(trip, "driving", 2.0, 90.0)
+        self.create_trip()
+        self.assertDriverTotalsMatchTrips(self.driver)
+
+        trip.refresh_from_db()
+        trip.driver = self.other_driver
+        trip.save()
+        self.assertDriverTotalsMatchTrips(self.driver)
+        self.assertDriverTotalsMatchTrips(self.other_driver)
+
+        trip.delete()
+        self.assertDriverTotalsMatchTrips(self.other_driver)
+
+    def test_cascaded_trip_deletes_keep_driver_totals(self):
+        carrier = Carrier.objects.create(name="Spare Haulage", dot_number="DOT00002")
+        spare = Vehicle.objects.create(
+            truck_number="TRK-0002", vin="VIN00000000002", carrier=carrier
+        )
+        kept = self.create_trip()
+        doomed = Trip.objects.create(
+            date=date(2026, 10, 15), driver=self.driver, vehicle=spare
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_event(kept, "driving", 1.0, 20.0)
+            self.add_event(doomed, "driving", 4.0, 99.0)
+
+        spare.delete()
+
+        self.assertDriverTotalsMatchTrips(self.driver)
+
+    def test_cascaded_event_deletes_recalculate_trip(self):
+        side_street = Location.objects.create(
+            address="2 Side St", latitude=40.5, longitude=-75.5
+        )
+        trip = self.create_trip()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_event(trip, "driving", 1.5, 60.0)
+            TripEvent.objects.create(
+                trip=trip,
+                location=side_street,
+                event_type="driving",
+                timestamp=timezone.now(),
+                duration=2.0,
+                miles_driven=80.0,
+            )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            side_street.delete()
+
+        self.assertTripTotals(trip, total_driving_hours=1.5, total_miles_driving=60.0)
+        self.assertDriverTotalsMatchTrips(self.driver)
+
+    def test_deleting_an_uncounted_trip_does_not_underflow(self):
+        Trip.objects.bulk_create(
+            [Trip(date=date(2026, 10, 15), driver=self.driver, vehicle=self.vehicle)]
+        )
+        trip = Trip.objects.get(driver=self.driver)
+
+        trip.delete()
+
+        self.driver.refresh_from_db()
+        self.assertEqual(self.driver.trip_count_cached, 0)
+
+    def test_refresh_cached_totals_matches_live_aggregate(self):
+        for driver, (hours, miles) in (
+            (self.driver, (2.0, 80.0)),
+            (self.other_driver, (7.5, 420.0)),
+        ):
+            trip = self.create_trip(driver=driver)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.add_event(trip, "driving", hours, miles)
+        Driver.objects.update(
+            total_miles_cached=0.0,
+            total_driving_hours_cached=0.0,
+            total_on_duty_hours_cached=0.0,
+            trip_count_cached=0,
+        )
+
+        Driver.refresh_cached_totals([self.driver.pk, self.other_driver.pk])
+
+        self.assertDriverTotalsMatchTrips(self.driver)
+        self.assertDriverTotalsMatchTrips(self.other_driver)
+
+
+class TripRowRenderingTests(TotalsTestCase):
+    def as_pairs(self, data):
+        # Objects become lists of pairs so key order is compared as well
+        return json.loads(dumps_json(data), object_pairs_hook=list)
+
+    def test_trip_rows_render_like_trip_serializer(self):
+        self.create_trip()
+        paired = Trip.objects.create(
+            date=date(2026, 10, 16),
+            driver=self.driver,
+            co_driver=self.other_driver,
+            vehicle=self.vehicle,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_event(paired, "on_duty", 0.5)
+            self.add_event(paired, "driving", 2.0, 110.0)
+            self.add_event(paired, "fuel_stop")
+
+        rows = Trip.objects.order_by("pk").values(*TRIP_VALUE_FIELDS)
+        trips = Trip.objects.order_by("pk")
+        self.assertEqual(
+            self.as_pairs(trip_rows_to_dicts(rows)),
+            self.as_pairs(TripSerializer(trips, many=True).data),
+        )
+
+
+class ViewTestCase(TotalsTestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        # Cached payloads would otherwise leak between tests
+        cache.clear()
+
+
+class ConditionalGetTests(ViewTestCase):
+    def assertRevalidates(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.has_header("ETag"))
+
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_cached_statistics_revalidate(self):
+        self.assertRevalidates(reverse("trip-statistics"))
+
+    def test_uncached_trip_listing_revalidates(self):
+        trip = self.create_trip()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_event(trip, "driving", 1.0, 40.0)
+        self.assertRevalidates(reverse("driver-trips", args=[self.driver.pk]))
+
+    def test_renaming_a_driver_changes_the_trip_listing_etag(self):
+        self.create_trip()
+        url = reverse("driver-trips", args=[self.driver.pk])
+        before = self.client.get(url)["ETag"]
+
+        Driver.objects.filter(pk=self.driver.pk).update(full_name="Alex Browne")
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=before)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], before)
+
+
+class AddEventTests(ViewTestCase):
+    def event_payload(self, address):
+        return {
+            "event_type": "driving",
+            "timestamp": "2026-10-15T09:00:00Z",
+            "duration": 2.0,
+            "miles_driven": 75.0,
+            "location_data": {"address": address, "latitude": 39.0, "longitude": -76.0},
+        }
+
+    def test_add_event_to_trip(self):
+        trip = self.create_trip()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("trip-add-event", args=[trip.pk]),
+                self.event_payload("4 Yard Ln"),
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertTripTotals(trip, total_driving_hours=2.0, total_miles_driving=75.0)
+
+    def test_add_event_to_missing_trip_is_404_and_creates_nothing(self):
+        response = self.client.post(
+            reverse("trip-add-event", args=[999999]),
+            self.event_payload("5 Nowhere Rd"),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(TripEvent.objects.exists())
+        self.assertFalse(Location.objects.filter(address="5 Nowhere Rd").exists())
+
+
+class RecentEventsCursorTests(ViewTestCase):
+    def test_keyset_pages_cover_every_event_once(self):
+        trip = self.create_trip()
+        now = timezone.now()
+        # Two events share a timestamp so the id tie-breaker is exercised
+        offsets = [1, 2, 2, 3, 4]
+        with self.captureOnCommitCallbacks(execute=True):
+            events = [
+                TripEvent.objects.create(
+                    trip=trip,
+                    location=self.location,
+                    event_type="on_duty",
+                    timestamp=now - timedelta(minutes=minutes),
+                )
+                for minutes in offsets
+            ]
+
+        url = reverse("tripevent-recent")
+        params = {"page_size": 2}
+        seen = []
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(event["id"] for event in response.json()["results"])
+            cursor = response.json()["next_cursor"]
+            if cursor is None:
+                break
+            params.update(cursor)
+
+        expected = sorted(events, key=lambda event: (event.timestamp, event.id))
+        self.assertEqual(seen, [event.id for event in reversed(expected)])
+
+    def test_malformed_cursor_is_400(self):
+        url = reverse("tripevent-recent")
+        for params in (
+            {"before": "yesterday", "before_id": 1},
+            {"before": "2026-13-01T00:00:00", "before_id": 1},
+            {"before": "2026-10-15T00:00:00Z", "before_id": "x"},
+            {"before": "2026-10-15T00:00:00Z"},
+        ):
+            with self.subTest(**params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_naive_cursor_is_accepted(self):
+        response = self.client.get(
+            reverse("tripevent-recent"),
+            {"before": "2026-10-15T00:00:00", "before_id": 1},
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class QueryParamValidationTests(ViewTestCase):
+    def test_non_numeric_hours_is_400(self):
+        response = self.client.get(reverse("tripevent-recent"), {"hours": "a day"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range_hours_are_clamped(self):
+        url = reverse("tripevent-recent")
+        for hours in (-5, 0, 100000):
+            with self.subTest(hours=hours):
+                response = self.client.get(url, {"hours": hours})
+                self.assertEqual(response.status_code, 200)
+
+    def test_bad_dates_are_400(self):
+        urls = (
+            reverse("trip-statistics"),
+            reverse("driver-hours-summary", args=[self.driver.pk]),
+        )
+        for url in urls:
+            for params in ({"date_from": "15/10/2026"}, {"date_to": "2026-02-30"}):
+                with self.subTest(url=url, **params):
+                    self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_hours_summary_agrees_with_and_without_a_date_range(self):
+        trip = self.create_trip()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_event(trip, "driving", 3.5, 140.0)
+        url = reverse("driver-hours-summary", args=[self.driver.pk])
+
+        lifetime = self.client.get(url).json()
+        ranged = self.client.get(url, {"date_from": "2026-01-01"}).json()
+
+        self.assertEqual(lifetime, ranged)
+        self.assertEqual(lifetime["trip_count"], 1)
+
+
+class TripEventFilterTests(ViewTestCase):
+    def test_trip_filter(self):
+        trip = self.create_trip()
+        other_trip = self.create_trip()
+        with self.captureOnCommitCallbacks(execute=True):
+            event = self.add_event(trip, "on_duty", 1.0)
+            self.add_event(other_trip, "on_duty", 1.0)
+
+        response = self.client.get(reverse("tripevent-list"), {"trip": trip.pk})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["id"] for row in response.json()["results"]], [event.pk])
+
+    def test_non_numeric_trip_filter_is_400(self):
+        response = self.client.get(reverse("tripevent-list"), {"trip": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ActiveTripStreamTests(ViewTestCase):
+    def stream(self):
+        response = self.client.get(reverse("trip-active"), {"stream": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/json")
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_empty_stream_is_an_empty_array(self):
+        self.assertEqual(self.stream(), [])
+
+    def test_stream_matches_the_paginated_listing(self):
+        for _ in range(3):
+            self.create_trip()
+        Trip.objects.create(
+            date=date(2026, 10, 14),
+            driver=self.driver,
+            vehicle=self.vehicle,
+            is_completed=True,
+        )
+
+        streamed = self.stream()
+        listed = self.client.get(reverse("trip-active")).json()["results"]
 
-# Create your tests here.
+        self.assertEqual(len(streamed), 3)
+        self.assertEqual(streamed, listed)
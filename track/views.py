@@ -8,9 +8,18 @@ from rest_framework.viewsets import GenericViewSet
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
-from django.db.models import Sum, Avg, Count, Q
+from rest_framework.exceptions import ValidationError
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum, Avg, Count, F, Q, Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django.utils import timezone
-from datetime import datetime, timedelta
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
+from datetime import date, timedelta
+from itertools import islice
+import hashlib
+import time
 
 from .models import Location, Driver, Carrier, Vehicle, Trip, TripEvent
 from .serializers import (
@@ -22,8 +31,119 @@ from .serializers import (
     TripCreateSerializer,
     TripEventSerializer,
     TripEventCreateSerializer,
+    TRIP_EVENT_VALUE_FIELDS,
+    TRIP_VALUE_FIELDS,
+    trip_event_to_dict,
+    trip_rows_to_dicts,
 )
-import traceback
+from .pagination import StandardResultsSetPagination
+from .renderers import dumps_json
+
+
+def _trip_qs_full():
+    """Trips with everything TripSerializer reads joined or prefetched"""
+    return Trip.objects.select_related(
+        "driver", "co_driver", "vehicle__carrier"
+    ).prefetch_related(
+        Prefetch(
+            "events",
+            queryset=TripEvent.objects.select_related("location").order_by(
+                "timestamp"
+            ),
+            to_attr="prefetched_events",
+        )
+    )
+
+
+# Columns TripSerializer renders; joined rows only load the names it shows
+TRIP_SERIALIZER_FIELDS = (
+    *(field.name for field in Trip._meta.concrete_fields),
+    "driver__full_name",
+    "co_driver__full_name",
+    "vehicle__truck_number",
+    "vehicle__carrier__name",
+)
+
+
+TRIP_STATS_CACHE_TIMEOUT = 60
+RECENT_EVENTS_CACHE_TIMEOUT = 30
+MAX_RECENT_HOURS = 24 * 7
+TRIP_STATS_VERSION_KEY = "trip:stats:version"
+STREAM_CHUNK_SIZE = 500
+
+# Built once; the ORM copies expressions when it resolves them per query
+TRIP_STATS_AGGREGATES = {
+    "total_trips": Count("id"),
+    "completed_trips": Count("id", filter=Q(is_completed=True)),
+    "total_miles": Sum("total_miles_driving"),
+    "total_driving_hours_sum": Sum("total_driving_hours"),
+    "avg_miles_per_trip": Avg("total_miles_driving"),
+    "avg_driving_hours": Avg("total_driving_hours"),
+}
+
+
+def _trip_stats_version():
+    return cache.get_or_set(TRIP_STATS_VERSION_KEY, time.time_ns, None)
+
+
+def _invalidate_trip_stats():
+    """Orphan every cached statistics entry by moving to a new key version"""
+    cache.set(TRIP_STATS_VERSION_KEY, time.time_ns(), None)
+
+
+def _date_param(request, name):
+    """Parse an optional YYYY-MM-DD query parameter, rejecting bad input with 400"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: "Enter a date in YYYY-MM-DD format."})
+
+
+def _cached_payload(key, timeout, build):
+    """Return (data, etag) for key, building and tagging the payload on a miss
+
+    The digest is cached with the payload so a hit is answered without
+    encoding it again.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        data = build()
+        digest = hashlib.md5(dumps_json(data), usedforsecurity=False).hexdigest()
+        entry = (data, f'"{digest}"')
+        cache.set(key, entry, timeout)
+    return entry
+
+
+def _tagged_response(request, data, etag):
+    """Respond with data under etag, or with a 304 if the client already has it"""
+    if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response["ETag"] = etag
+    return response
+
+
+def _stream_trip_rows(trip_rows, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield trip rows as a JSON array, rendering chunk_size trips at a time"""
+    rows = trip_rows.iterator(chunk_size=chunk_size)
+    separator = b"["
+    while chunk := list(islice(rows, chunk_size)):
+        for trip in trip_rows_to_dicts(chunk):
+            yield separator + dumps_json(trip)
+            separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+def _pk_or_404(pk):
+    """Coerce a URL pk to an int so it can be filtered on without a lookup"""
+    try:
+        return int(pk)
+    except (TypeError, ValueError):
+        raise Http404
 
 
 class LocationViewSet(
@@ -38,13 +158,20 @@ class LocationViewSet(
     @action(detail=False, methods=["get"])
     def search(self, request):
         """Search locations by address"""
-        query = request.query_params.get("q", "")
-        if query:
-            locations = self.get_queryset().filter(address__icontains=query)[:10]
-            serializer = self.get_serializer(locations, many=True)
+        query = request.query_params.get("q", "").strip()
+        if len(query) < 2:
+            return Response([])
 
-            return Response(serializer.data)
-        return Response([])
+        # ILIKE '%q%' is served by the pg_trgm GIN index on PostgreSQL
+        locations = self.get_queryset().filter(address__icontains=query)
+        if connection.vendor == "postgresql":
+            from django.contrib.postgres.search import TrigramSimilarity
+
+            locations = locations.annotate(
+                similarity=TrigramSimilarity("address", query)
+            ).order_by("-similarity")
+        locations = locations.values(*LocationSerializer.Meta.fields)[:10]
+        return Response(list(locations))
 
 
 class DriverViewSet(
@@ -56,34 +183,63 @@ class DriverViewSet(
 ):
     queryset = Driver.objects.all()
     serializer_class = DriverSerializer
+    pagination_class = StandardResultsSetPagination
 
     @action(detail=True, methods=["get"])
     def trips(self, request, pk=None):
         """Get trips for a specific driver"""
-        driver = self.get_object()
-        trips = Trip.objects.filter(driver=driver).order_by("-date")
-        serializer = TripSerializer(trips, many=True)
-        return Response(serializer.data)
+        driver_id = _pk_or_404(pk)
+        trips = (
+            _trip_qs_full()
+            .filter(driver_id=driver_id)
+            .order_by("-date")
+            .only(*TRIP_SERIALIZER_FIELDS)
+        )
+        page = self.paginate_queryset(trips)
+        if not page and not Driver.objects.filter(pk=driver_id).exists():
+            raise Http404
+        serializer = TripSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=["get"])
     def hours_summary(self, request, pk=None):
         """Get hours summary for a driver"""
-        driver = self.get_object()
-        date_from = request.query_params.get("date_from")
-        date_to = request.query_params.get("date_to")
-
-        trips = Trip.objects.filter(driver=driver)
+        driver_id = _pk_or_404(pk)
+        date_from = _date_param(request, "date_from")
+        date_to = _date_param(request, "date_to")
+
+        if not date_from and not date_to:
+            # Lifetime totals are kept on the driver row; no trip scan needed
+            summary = (
+                Driver.objects.filter(pk=driver_id)
+                .values(
+                    total_driving_hours=F("total_driving_hours_cached"),
+                    total_on_duty_hours=F("total_on_duty_hours_cached"),
+                    total_miles=F("total_miles_cached"),
+                    trip_count=F("trip_count_cached"),
+                )
+                .first()
+            )
+            if summary is None:
+                raise Http404
+            return Response(summary)
+
+        trips = Trip.objects.filter(driver_id=driver_id)
         if date_from:
             trips = trips.filter(date__gte=date_from)
         if date_to:
             trips = trips.filter(date__lte=date_to)
 
         summary = trips.aggregate(
-            total_driving_hours=Sum("total_driving_hours"),
-            total_on_duty_hours=Sum("total_on_duty_hours"),
-            total_miles=Sum("total_miles_driving"),
+            # default=0.0 matches the cached columns for a driver with no trips
+            total_driving_hours=Sum("total_driving_hours", default=0.0),
+            total_on_duty_hours=Sum("total_on_duty_hours", default=0.0),
+            total_miles=Sum("total_miles_driving", default=0.0),
             trip_count=Count("id"),
         )
+        if not summary["trip_count"]:
+            if not Driver.objects.filter(pk=driver_id).exists():
+                raise Http404
 
         return Response(summary)
 
@@ -95,7 +251,7 @@ class CarrierViewSet(
     UpdateModelMixin,
     GenericViewSet,
 ):
-    queryset = Carrier.objects.all()
+    queryset = Carrier.objects.annotate(_vehicles_count=Count("vehicles"))
     serializer_class = CarrierSerializer
 
 
@@ -108,14 +264,23 @@ class VehicleViewSet(
 ):
     queryset = Vehicle.objects.select_related("carrier")
     serializer_class = VehicleSerializer
+    pagination_class = StandardResultsSetPagination
 
     @action(detail=True, methods=["get"])
     def trips(self, request, pk=None):
         """Get trips for a specific vehicle"""
-        vehicle = self.get_object()
-        trips = Trip.objects.filter(vehicle=vehicle).order_by("-date")
-        serializer = TripSerializer(trips, many=True)
-        return Response(serializer.data)
+        vehicle_id = _pk_or_404(pk)
+        trips = (
+            _trip_qs_full()
+            .filter(vehicle_id=vehicle_id)
+            .order_by("-date")
+            .only(*TRIP_SERIALIZER_FIELDS)
+        )
+        page = self.paginate_queryset(trips)
+        if not page and not Vehicle.objects.filter(pk=vehicle_id).exists():
+            raise Http404
+        serializer = TripSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class TripViewSet(
@@ -126,72 +291,119 @@ class TripViewSet(
     GenericViewSet,
 ):
 
-    queryset = Trip.objects.select_related(
-        "driver", "co_driver", "vehicle__carrier"
-    ).prefetch_related("events__location")
-    # print(traceback.format_exc())
+    queryset = _trip_qs_full()
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        # Only actions that render TripSerializer need the joins and events
+        if self.action == "retrieve":
+            return super().get_queryset().only(*TRIP_SERIALIZER_FIELDS)
+        if self.action in ("update", "partial_update"):
+            return super().get_queryset()
+        return Trip.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        # Plain rows instead of model instances; trip_rows_to_dicts loads the
+        # events of the whole page in one query and buckets them by trip.
+        trips = self.filter_queryset(self.get_queryset()).values(*TRIP_VALUE_FIELDS)
+        page = self.paginate_queryset(trips)
+        if page is not None:
+            return self.get_paginated_response(trip_rows_to_dicts(page))
+        return Response(trip_rows_to_dicts(trips))
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        _invalidate_trip_stats()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        _invalidate_trip_stats()
 
     def get_serializer_class(self):
         if self.action == "create":
             return TripCreateSerializer
-        # print(traceback.format_exc())
         return TripSerializer
 
     @action(detail=True, methods=["post"])
     def add_event(self, request, pk=None):
         """Add a new event to a trip"""
-        trip = self.get_object()
+        trip_id = _pk_or_404(pk)
         serializer = TripEventCreateSerializer(data=request.data)
 
         if serializer.is_valid():
-            serializer.save(trip=trip)
+            trips = Trip.objects.filter(pk=trip_id)
+            if connection.in_atomic_block:
+                # Inside an outer transaction (ATOMIC_REQUESTS, tests) the
+                # deferred FK check only runs at the outer commit, too late
+                # for a 404, so look the trip up first.
+                if not trips.exists():
+                    raise Http404
+                with transaction.atomic():
+                    serializer.save(trip_id=trip_id)
+            else:
+                # Outermost block: the trip FK is checked as it commits, so the
+                # happy path needs no lookup and a missing trip rolls the event
+                # and its location back.
+                try:
+                    with transaction.atomic():
+                        serializer.save(trip_id=trip_id)
+                except IntegrityError:
+                    if trips.exists():
+                        raise
+                    raise Http404
+            _invalidate_trip_stats()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        # print(traceback.format_exc())
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=["post"])
     def complete(self, request, pk=None):
         """Mark trip as completed"""
-        trip = self.get_object()
-        trip.is_completed = True
-        trip.save()
-        # print(traceback.format_exc())
+        updated = Trip.objects.filter(pk=_pk_or_404(pk)).update(
+            is_completed=True, updated_at=timezone.now()
+        )
+        if not updated:
+            raise Http404
+        _invalidate_trip_stats()
         return Response({"status": "Trip marked as completed"})
 
     @action(detail=False, methods=["get"])
     def statistics(self, request):
         """Get trip statistics"""
-        queryset = self.get_queryset()
+        # Aggregates only read Trip columns, so skip the joins and prefetch
+        queryset = Trip.objects.all()
 
         # Filter by date range if provided
-        date_from = request.query_params.get("date_from")
-        date_to = request.query_params.get("date_to")
+        date_from = _date_param(request, "date_from")
+        date_to = _date_param(request, "date_to")
         if date_from:
             queryset = queryset.filter(date__gte=date_from)
         if date_to:
             queryset = queryset.filter(date__lte=date_to)
 
-        stats = queryset.aggregate(
-            total_trips=Count("id"),
-            completed_trips=Count("id", filter=Q(is_completed=True)),
-            total_miles=Sum("total_miles_driving"),
-            total_driving_hours_sum=Sum("total_driving_hours"),
-            avg_miles_per_trip=Avg("total_miles_driving"),
-            avg_driving_hours=Avg("total_driving_hours"),
+        key = f"trip:stats:{_trip_stats_version()}:{date_from}:{date_to}"
+        stats, etag = _cached_payload(
+            key,
+            TRIP_STATS_CACHE_TIMEOUT,
+            lambda: queryset.aggregate(**TRIP_STATS_AGGREGATES),
         )
-        # print(traceback.format_exc())
-
-        return Response(stats)
+        return _tagged_response(request, stats, etag)
 
     @action(detail=False, methods=["get"])
     def active(self, request):
         """Get active (incomplete) trips"""
-        active_trips = self.get_queryset().filter(is_completed=False)
-        serializer = self.get_serializer(active_trips, many=True)
-        # print(traceback.format_exc())
-        return Response(serializer.data)
-
-    # print(traceback.format_exc())
+        active_trips = Trip.objects.filter(is_completed=False).values(
+            *TRIP_VALUE_FIELDS
+        )
+        if request.query_params.get("stream") == "1":
+            # ?stream=1 sends every active trip unpaginated, holding only
+            # one chunk of rows in memory at a time
+            return StreamingHttpResponse(
+                _stream_trip_rows(active_trips), content_type="application/json"
+            )
+        page = self.paginate_queryset(active_trips)
+        if page is not None:
+            return self.get_paginated_response(trip_rows_to_dicts(page))
+        return Response(trip_rows_to_dicts(active_trips))
 
 
 class TripEventViewSet(
@@ -201,29 +413,82 @@ class TripEventViewSet(
     UpdateModelMixin,
     GenericViewSet,
 ):
-    queryset = TripEvent.objects.select_related("trip", "location")
+    queryset = TripEvent.objects.select_related("location")
+    pagination_class = StandardResultsSetPagination
 
     def get_serializer_class(self):
         if self.action == "create":
             return TripEventCreateSerializer
         return TripEventSerializer
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        _invalidate_trip_stats()
+
     def get_queryset(self):
         queryset = super().get_queryset()
         trip_id = self.request.query_params.get("trip")
         if trip_id:
-            queryset = queryset.filter(trip__id=trip_id)
+            try:
+                trip_id = int(trip_id)
+            except ValueError:
+                raise ValidationError({"trip": "A numeric trip id is required."})
+            queryset = queryset.filter(trip_id=trip_id)
         return queryset
 
     @action(detail=False, methods=["get"])
     def recent(self, request):
         """Get recent events"""
-        hours = int(request.query_params.get("hours", 24))
+        try:
+            hours = int(request.query_params.get("hours", 24))
+        except ValueError:
+            raise ValidationError({"hours": "A whole number of hours is required."})
+        hours = min(max(hours, 1), MAX_RECENT_HOURS)
         since = timezone.now() - timedelta(hours=hours)
+        recent_events = self.get_queryset().filter(timestamp__gte=since)
 
-        recent_events = (
-            self.get_queryset().filter(timestamp__gte=since).order_by("-timestamp")[:50]
+        key = f"trip_events:recent:{request.build_absolute_uri()}"
+        data, etag = _cached_payload(
+            key,
+            RECENT_EVENTS_CACHE_TIMEOUT,
+            lambda: self._recent_events_data(request, recent_events),
         )
-
-        serializer = self.get_serializer(recent_events, many=True)
-        return Response(serializer.data)
+        return _tagged_response(request, data, etag)
+
+    def _recent_events_data(self, request, recent_events):
+
+        # Keyset pagination: continue strictly after the last (timestamp, id)
+        # of the previous page so deep pages stay an index seek.
+        before = request.query_params.get("before")
+        if before:
+            try:
+                # parse_datetime returns None for a bad format but raises
+                # ValueError for a well-formed yet impossible date
+                before_ts = parse_datetime(before)
+                before_id = int(request.query_params.get("before_id", ""))
+            except ValueError:
+                before_ts = None
+            if before_ts is None:
+                raise ValidationError(
+                    {"detail": "before must be an ISO timestamp and before_id an id"}
+                )
+            if timezone.is_naive(before_ts):
+                before_ts = timezone.make_aware(before_ts)
+            recent_events = recent_events.filter(
+                Q(timestamp__lt=before_ts) | Q(timestamp=before_ts, id__lt=before_id)
+            )
+
+        page_size = self.paginator.get_page_size(request)
+        rows = list(
+            recent_events.order_by("-timestamp", "-id").values(
+                *TRIP_EVENT_VALUE_FIELDS
+            )[: page_size + 1]
+        )
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = {"before": rows[-1]["timestamp"], "before_id": rows[-1]["id"]}
+        return {
+            "results": [trip_event_to_dict(row) for row in rows],
+            "next_cursor": next_cursor,
+        }